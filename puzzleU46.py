@@ -1,7 +1,28 @@
 import streamlit as st
+import collections
+import datetime
+import os
 import random
+import tempfile
+import threading
+import time
 import uuid
 import pandas as pd
+import streamlit.components.v1 as components
+
+from puzzleU46_bank import (
+    build_item_prompt,
+    build_round_plan as bank_build_round_plan,
+    read_question_bank,
+)
+from puzzleU46_results import (
+    DEFAULT_DB_PATH,
+    count_results,
+    export_results,
+    open_results_db,
+    open_results_db_readonly,
+    save_answers,
+)
 
 # ====== App 基本設定 ======
 st.set_page_config(
@@ -122,82 +143,8 @@ div[data-testid="stVerticalBlock"] > div:has(> div[data-testid="stRadio"]) {
 # ===================== 題庫讀取：English / Chinese 兩欄 =====================
 @st.cache_data
 def load_question_bank(xlsx_path="puzzleU46.xlsx"):
-    """
-    自動對應：
-      english_col ← ["english","英文","term","英文名","en","english term"]
-      chinese_col ← ["chinese","中文","名稱","name","cn","chinese name","中文名"]
-
-    回傳:
-    {
-        "ok": bool,
-        "error": str,
-        "bank": [ { "english":..., "chinese":...}, ... ],
-        "debug_cols": [...]
-    }
-    """
-    try:
-        df = pd.read_excel(xlsx_path)
-    except Exception as e:
-        return {
-            "ok": False,
-            "error": f"無法讀取題庫檔案 {xlsx_path} ：{e}",
-            "bank": [],
-            "debug_cols": []
-        }
-
-    def norm(s):
-        return str(s).strip().lower()
-
-    cols_norm = {norm(c): c for c in df.columns}
-
-    eng_candidates = [
-        "english","英文","term","英文名","en","english term"
-    ]
-    chi_candidates = [
-        "chinese","中文","名稱","name","cn","chinese name","中文名"
-    ]
-
-    def pick_col(cands):
-        for cand in cands:
-            if cand in cols_norm:
-                return cols_norm[cand]
-        return None
-
-    eng_col = pick_col(eng_candidates)
-    chi_col = pick_col(chi_candidates)
-
-    if eng_col is None or chi_col is None:
-        return {
-            "ok": False,
-            "error": (
-                "找不到必要欄位。\n"
-                f"檔案欄位：{list(df.columns)}\n"
-                f"English 欄候選：{eng_candidates}\n"
-                f"Chinese 欄候選：{chi_candidates}\n"
-                "請把 Excel 欄位命名成其中一個候選名稱（如 English / Chinese）。"
-            ),
-            "bank": [],
-            "debug_cols": list(df.columns)
-        }
-
-    def clean(v):
-        if pd.isna(v):
-            return ""
-        return str(v).strip()
-
-    bank_list = []
-    for _, row in df.iterrows():
-        en = clean(row.get(eng_col, ""))
-        ch = clean(row.get(chi_col, ""))
-        if en and ch:
-            bank_list.append({"english": en, "chinese": ch})
-
-    return {
-        "ok": True,
-        "error": "",
-        "bank": bank_list,
-        "debug_cols": list(df.columns)
-    }
+    """讀題庫（快取）；細節見 puzzleU46_bank.read_question_bank"""
+    return read_question_bank(xlsx_path)
 
 loaded = load_question_bank()
 QUESTION_BANK = loaded["bank"]
@@ -208,8 +155,12 @@ if not loaded["ok"] or not QUESTION_BANK:
 
 
 # ===================== 遊戲常數 =====================
-MAX_ROUNDS = 3
-QUESTIONS_PER_ROUND = 10
+MAX_ROUNDS = 3                 # 預設回合數
+QUESTIONS_PER_ROUND = 10       # 預設每回合題數
+ROUND_LIMIT_CHOICES = [1, 2, 3, 5, 10, 0]      # 0 = 無限練習
+RECORDS_HISTORY_LIMIT = 200    # records 只保留最近幾筆（舊的只留在統計 / 資料庫）
+APP_EXPORT_MAX_ROWS = 50000    # 網頁匯出上限（下載要整個檔案載入記憶體），更多請用命令列
+CLASS_ROOM_TTL_SECONDS = 12 * 60 * 60   # 班級課堂開設後最多保留多久（老師忘了按結束也會清掉）
 
 MODE_1 = "模式一：English ➜ 中文"
 MODE_2 = "模式二：中文 ➜ English"
@@ -224,33 +175,39 @@ SUBMODE_NAME_TO_CODE = {
     MODE_3: "chi_to_eng_input",    # 題幹 Chinese，輸入 English
 }
 
-SUBMODE_LIST_FOR_MIX = [
-    "eng_to_chi_mc",
-    "chi_to_eng_mc",
-    "chi_to_eng_input"
-]
-
 
 # ===================== 狀態初始化 =====================
 def init_quiz_state():
     """初始化 quiz 運行用 state，不動玩家個資"""
-    st.session_state.round = 1                 # 當前回合 (1..MAX_ROUNDS) / None=結束
+    st.session_state.round = 1                 # 當前回合 (1..round_limit) / None=結束
     st.session_state.cur_round_qidx = []       # 這回合的題目 index 清單
     st.session_state.cur_idx_in_round = 0      # 目前在第幾題 (0-based)
     st.session_state.score_this_round = 0      # 本回合得分
     st.session_state.submitted = False         # 這一題是否已經送出
     st.session_state.last_feedback = ""        # 顯示在題目下方的HTML
+    st.session_state.last_review_md = ""       # 題目提交後的小複習（markdown）
     st.session_state.answer_cache = ""         # 模式三的輸入暫存
-    st.session_state.options_cache = {}        # (qidx, submode_code)-> {"display":[...]}
+    st.session_state.round_plan = None         # 本回合預先算好的題目計畫（班級模式為全班共用）
+    st.session_state.client_round_payload = None # 快速模式送給瀏覽器的整回合題目
     st.session_state.submode_per_question = [] # 與 cur_round_qidx 對齊
-    st.session_state.records = []              # 全部作答紀錄(跨回合)
+    st.session_state.records = collections.deque(maxlen=RECORDS_HISTORY_LIMIT)  # 最近的作答紀錄(跨回合)
+    st.session_state.stats = {"answered": 0, "correct": 0}  # 全部作答的累計統計
     st.session_state.used_keys = set()         # 用過的英文詞，避免重複
     st.session_state.ask_continue = False      # 回合結束後：要不要繼續？出現詢問畫面
     st.session_state.quiz_done = False         # 全部結束了沒
     st.session_state.show_wrong_review = False # 是否顯示錯題回顧畫面
+    st.session_state.review_tables = None      # 錯題回顧表格（結束時算一次）
 
     if "session_id" not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
+    if "class_code" not in st.session_state:
+        st.session_state.class_code = ""       # 加入的班級課堂代碼（""=個人練習）
+        st.session_state.class_room_id = ""    # 加入的課堂唯一 ID（代碼會重複使用）
+        st.session_state.class_round = 0       # 目前作答的是課堂第幾回合的題目
+    if "teacher_room_code" not in st.session_state:
+        st.session_state.teacher_room_code = "" # 老師開設的課堂代碼
+    if "client_side_rounds" not in st.session_state:
+        st.session_state.client_side_rounds = False  # 快速模式：整回合在瀏覽器作答
 
 
 def ensure_state_ready():
@@ -266,15 +223,26 @@ def ensure_state_ready():
         "score_this_round",
         "submitted",
         "last_feedback",
+        "last_review_md",
         "answer_cache",
-        "options_cache",
+        "round_plan",
+        "client_round_payload",
         "session_id",
+        "class_code",
+        "class_room_id",
+        "class_round",
+        "teacher_room_code",
+        "client_side_rounds",
         "submode_per_question",
         "records",
+        "stats",
+        "round_limit",
+        "questions_per_round",
         "used_keys",
         "ask_continue",
         "quiz_done",
-        "show_wrong_review"
+        "show_wrong_review",
+        "review_tables"
     ]
     if any(k not in st.session_state for k in base_keys):
         if "mode_locked" not in st.session_state:
@@ -287,125 +255,67 @@ def ensure_state_ready():
             st.session_state.user_class = ""
         if "user_seat" not in st.session_state:
             st.session_state.user_seat = ""
+        if "round_limit" not in st.session_state:
+            st.session_state.round_limit = MAX_ROUNDS            # None = 無限練習
+        if "questions_per_round" not in st.session_state:
+            st.session_state.questions_per_round = QUESTIONS_PER_ROUND
         init_quiz_state()
 
 
-def start_new_round():
-    """抽新回合10題 + 安排子模式"""
-    # 避免重複：以 english 當 key
-    remaining = [
-        i for i, it in enumerate(QUESTION_BANK)
-        if it["english"] not in st.session_state.used_keys
-    ]
-    # 如果都用光了，就清空 used_keys
-    if not remaining:
-        st.session_state.used_keys = set()
-        remaining = list(range(len(QUESTION_BANK)))
-
-    # 抽題
-    if len(remaining) <= QUESTIONS_PER_ROUND:
-        chosen = remaining[:]
-        random.shuffle(chosen)
-    else:
-        chosen = random.sample(remaining, QUESTIONS_PER_ROUND)
+def build_round_plan(mode_label, used_keys=(), n_questions=None, pool=None):
+    """依模式預先算好一回合的題目計畫（見 puzzleU46_bank.build_round_plan）"""
+    submode_code = None if mode_label == MODE_4 else SUBMODE_NAME_TO_CODE[mode_label]
+    return bank_build_round_plan(
+        QUESTION_BANK,
+        submode_code,
+        n_questions or st.session_state.questions_per_round,
+        used_keys,
+        pool=pool
+    )
+
+
+def start_new_round(plan=None):
+    """開新回合：plan=None 時自己抽題；班級模式則傳入老師的共用計畫"""
+    if plan is None:
+        # 如果都用光了，就清空 used_keys
+        if all(it["english"] in st.session_state.used_keys for it in QUESTION_BANK):
+            st.session_state.used_keys = set()
+        plan = build_round_plan(
+            st.session_state.chosen_mode_label,
+            st.session_state.used_keys
+        )
 
-    st.session_state.cur_round_qidx = chosen
+    st.session_state.round_plan = plan
+    st.session_state.cur_round_qidx = plan["qidx"]
+    st.session_state.submode_per_question = plan["submodes"]
     st.session_state.cur_idx_in_round = 0
     st.session_state.score_this_round = 0
     st.session_state.submitted = False
     st.session_state.last_feedback = ""
+    st.session_state.last_review_md = ""
     st.session_state.answer_cache = ""
-    st.session_state.options_cache = {}
     st.session_state.ask_continue = False
-
-    # 產生每題子模式
-    if st.session_state.chosen_mode_label == MODE_4:
-        st.session_state.submode_per_question = [
-            random.choice(SUBMODE_LIST_FOR_MIX) for _ in chosen
-        ]
-    else:
-        code = SUBMODE_NAME_TO_CODE[st.session_state.chosen_mode_label]
-        st.session_state.submode_per_question = [code for _ in chosen]
-
-
-ensure_state_ready()
-if st.session_state.mode_locked and st.session_state.round and not st.session_state.cur_round_qidx:
-    # first entry into quiz page after picking mode
-    start_new_round()
+    # 快速模式：整回合的題目在開回合時就打包好，之後只送這一份給瀏覽器
+    if st.session_state.client_side_rounds:
+        st.session_state.client_round_payload = build_client_round_payload(
+            plan, st.session_state.round
+        )
 
 
 # ===================== 工具：產生選項 (for MC modes) =====================
 def get_options_for_q(qidx, submode_code):
     """
-    submode_code:
-      eng_to_chi_mc    題幹 English，選 Chinese
-      chi_to_eng_mc    題幹 Chinese，選 English
-      chi_to_eng_input 手寫 => 不用選項
     回傳:
-      { "display": [...兩個選項字串...] }  (only for MC)
+      { "display": (...兩個選項字串...) }  (only for MC)
+    選項在開回合時由 build_round_plan 一次算好。
     """
-    key = (qidx, submode_code)
-    if key in st.session_state.options_cache:
-        return st.session_state.options_cache[key]
-
-    item = QUESTION_BANK[qidx]
-    correct_en = item["english"].strip()
-    correct_ch = item["chinese"].strip()
-
-    pool_en = [it["english"].strip() for it in QUESTION_BANK
-               if it["english"].strip().lower() != correct_en.lower()]
-    pool_ch = [it["chinese"].strip() for it in QUESTION_BANK
-               if it["chinese"].strip() != correct_ch]
-
-    if submode_code == "eng_to_chi_mc":
-        # 正解 = 中文
-        distractor = random.choice(pool_ch) if pool_ch else "???"
-        opts = [correct_ch, distractor]
-
-    elif submode_code == "chi_to_eng_mc":
-        # 正解 = English
-        distractor = random.choice(pool_en) if pool_en else "???"
-        opts = [correct_en, distractor]
-
-    else:
-        # 手寫模式不需要選項
-        st.session_state.options_cache[key] = {"display": []}
-        return {"display": []}
-
-    random.shuffle(opts)
-    st.session_state.options_cache[key] = {"display": opts[:]}
-    return {"display": opts[:]}
+    return st.session_state.round_plan["options"][(qidx, submode_code)]
 
 
 def build_question_prompt(qidx, submode_code):
     """回傳題目文字 + 正解(英/中) + 額外提示(模式三)"""
     item = QUESTION_BANK[qidx]
-    en = item["english"].strip()
-    ch = item["chinese"].strip()
-
-    if submode_code == "eng_to_chi_mc":
-        # 給英文，問中文
-        prompt_txt = en
-        question_text = f'「{prompt_txt}」對應的正確中文是？'
-        correct_answer = ch
-        hint = ""
-    elif submode_code == "chi_to_eng_mc":
-        # 給中文，問英文 (選擇)
-        prompt_txt = ch
-        question_text = f'「{prompt_txt}」的正確英文是？'
-        correct_answer = en
-        hint = ""
-    else:
-        # chi_to_eng_input：給中文，手寫英文
-        prompt_txt = ch
-        # 提示：英文首尾字母
-        if len(en) >= 2:
-            hint = f"(提示: {en[0]} ... {en[-1]})"
-        else:
-            hint = f"(提示: {en})"
-        question_text = f'「{prompt_txt}」的正確英文是？ {hint}'
-        correct_answer = en
-
+    question_text, correct_answer, hint = build_item_prompt(item, submode_code)
     return question_text, correct_answer, item, hint
 
 
@@ -419,6 +329,226 @@ def prompt_for_record(qidx, submode_code):
         return item["chinese"].strip()
 
 
+def build_answer_review_md(item, submode_code, opts_disp):
+    """題目提交後的小複習：正解 +（選擇題）兩個選項的英中對照"""
+    if submode_code == "eng_to_chi_mc":
+        lines = [
+            f"**正確中文：{item['chinese'].strip()}** "
+            f"(English: {item['english'].strip()})"
+        ]
+    else:
+        # chi_to_eng_mc / chi_to_eng_input
+        lines = [
+            f"**正確英文：{item['english'].strip()}** "
+            f"(中文：{item['chinese'].strip()})"
+        ]
+
+    # 顯示本題兩個選項（若是選擇題）
+    if submode_code in ["eng_to_chi_mc", "chi_to_eng_mc"] and opts_disp:
+        nice_list = []
+        for opt in opts_disp:
+            opt_clean = opt.strip().lower()
+            match_item = None
+            for it in QUESTION_BANK:
+                if it["english"].strip().lower() == opt_clean or it["chinese"].strip() == opt.strip():
+                    match_item = it
+                    break
+            if match_item:
+                nice_list.append(
+                    f"{match_item['english'].strip()} / {match_item['chinese'].strip()}"
+                )
+            else:
+                nice_list.append(opt.strip())
+        lines.append("**本題兩個選項：**")
+        lines.append("、".join(nice_list))
+
+    return "\n\n".join(lines)
+
+
+# ===================== 作答紀錄資料庫（跨 session 共用） =====================
+@st.cache_resource
+def get_results_db():
+    """整個 server 共用一條 SQLite 連線，寫入時拿 lock"""
+    return {"lock": threading.Lock(), "conn": open_results_db()}
+
+
+def append_records(recs):
+    """把作答紀錄加進 records / 累計統計，並一次寫進資料庫"""
+    rows = []
+    for rec in recs:
+        rnd, prompt_txt, stu_ans, corr_ans, is_correct, _, submode_code, _ = rec
+        st.session_state.records.append(rec)
+        st.session_state.stats["answered"] += 1
+        if is_correct:
+            st.session_state.stats["correct"] += 1
+        rows.append({
+            "session_id": st.session_state.session_id,
+            "class_code": st.session_state.class_code,
+            "room_id": st.session_state.class_room_id if st.session_state.class_code else "",
+            "user_name": st.session_state.user_name,
+            "user_class": st.session_state.user_class,
+            "user_seat": st.session_state.user_seat,
+            "round": rnd,
+            "submode": submode_code,
+            "prompt": prompt_txt,
+            "student_answer": stu_ans,
+            "correct_answer": corr_ans,
+            "is_correct": is_correct,
+        })
+    db = get_results_db()
+    with db["lock"]:
+        save_answers(db["conn"], rows)
+
+
+# ===================== 班級同步課堂（跨 session 共用） =====================
+@st.cache_resource
+def get_class_registry():
+    """
+    全部 session 共用的課堂登記表（同一個 server process 內只有一份）。
+    rooms: { code: room }，讀寫都要拿 lock。
+
+    room:
+    {
+        "code": str,                  # 4 位數代碼，課堂結束後會重複使用
+        "room_id": str,               # 這堂課的唯一 ID（存進作答紀錄）
+        "mode_label": str,
+        "round": int,                 # 課堂目前第幾回合
+        "plan": {...},                # build_round_plan() 的結果，全班唯讀共用
+        "used_keys": set,             # 課堂已出過的英文詞
+        "students": {
+            session_id: {"name","class","seat","round","answers": {pos: is_correct}}
+        },
+        "created_at": float           # 超過 CLASS_ROOM_TTL_SECONDS 就會被清掉
+    }
+    """
+    return {"lock": threading.Lock(), "rooms": {}}
+
+
+def create_class_room(mode_label, n_questions):
+    """老師開課：產生代碼 + 算好第一回合計畫"""
+    registry = get_class_registry()
+    plan = build_round_plan(mode_label, n_questions=n_questions)
+    with registry["lock"]:
+        evict_expired_class_rooms(registry)
+        code = f"{random.randint(0, 9999):04d}"
+        while code in registry["rooms"]:
+            code = f"{random.randint(0, 9999):04d}"
+        registry["rooms"][code] = {
+            "code": code,
+            "room_id": str(uuid.uuid4()),
+            "mode_label": mode_label,
+            "n_questions": n_questions,
+            "round": 1,
+            "plan": plan,
+            "used_keys": {QUESTION_BANK[i]["english"] for i in plan["qidx"]},
+            "students": {},
+            "created_at": time.time(),
+        }
+    return code
+
+
+def is_class_room_expired(room, now=None):
+    return (now or time.time()) - room["created_at"] > CLASS_ROOM_TTL_SECONDS
+
+
+def evict_expired_class_rooms(registry):
+    """清掉開太久的課堂（呼叫端要先拿 lock）"""
+    now = time.time()
+    for code in [c for c, room in registry["rooms"].items() if is_class_room_expired(room, now)]:
+        del registry["rooms"][code]
+
+
+def get_class_room(code):
+    """找課堂；已過期的當成不存在並順手清掉"""
+    registry = get_class_registry()
+    code = (code or "").strip()
+    room = registry["rooms"].get(code)
+    if room is not None and is_class_room_expired(room):
+        with registry["lock"]:
+            registry["rooms"].pop(code, None)
+        return None
+    return room
+
+
+def publish_next_class_round(code):
+    """老師發布下一回合：整班換成新的共用計畫"""
+    registry = get_class_registry()
+    room = get_class_room(code)
+    if room is None:
+        return
+    if all(it["english"] in room["used_keys"] for it in QUESTION_BANK):
+        used = set()
+    else:
+        used = room["used_keys"]
+    plan = build_round_plan(room["mode_label"], used, n_questions=room["n_questions"])
+    with registry["lock"]:
+        room["used_keys"] = used | {QUESTION_BANK[i]["english"] for i in plan["qidx"]}
+        room["plan"] = plan
+        room["round"] += 1
+
+
+def close_class_room(code):
+    registry = get_class_registry()
+    with registry["lock"]:
+        registry["rooms"].pop(code, None)
+
+
+def start_class_round():
+    """學生用課堂目前的共用計畫開始作答；課堂不存在回傳 False"""
+    room = get_class_room(st.session_state.class_code)
+    if room is None:
+        return False
+    registry = get_class_registry()
+    with registry["lock"]:
+        stu = room["students"].get(st.session_state.session_id)
+        # 同一回合重新進來（例如「再玩一次」）時保留已回報的成績
+        if stu is None or stu["round"] != room["round"]:
+            room["students"][st.session_state.session_id] = {
+                "name": st.session_state.user_name,
+                "class": st.session_state.user_class,
+                "seat": st.session_state.user_seat,
+                "round": room["round"],
+                "answers": {},
+            }
+        plan = room["plan"]
+        st.session_state.class_round = room["round"]
+        st.session_state.class_room_id = room["room_id"]
+    start_new_round(plan=plan)
+    return True
+
+
+def report_class_answers(results):
+    """把學生的對錯 {pos: is_correct} 回報給老師端（只有加入課堂時才會寫；每題只算第一次作答）"""
+    room = get_class_room(st.session_state.class_code)
+    if room is None:
+        return
+    registry = get_class_registry()
+    with registry["lock"]:
+        stu = room["students"].get(st.session_state.session_id)
+        if stu is None or stu["round"] != st.session_state.class_round:
+            return
+        stu["name"] = st.session_state.user_name
+        for pos, is_correct in results.items():
+            stu["answers"].setdefault(pos, is_correct)
+
+
+def class_round_stats(room):
+    """彙整課堂目前回合每一題的作答人數 / 答對人數"""
+    registry = get_class_registry()
+    with registry["lock"]:
+        n_questions = len(room["plan"]["qidx"])
+        joined = [s for s in room["students"].values() if s["round"] == room["round"]]
+        answered = [0] * n_questions
+        correct = [0] * n_questions
+        for stu in joined:
+            for pos, ok in stu["answers"].items():
+                answered[pos] += 1
+                if ok:
+                    correct[pos] += 1
+        finished = sum(1 for s in joined if len(s["answers"]) >= n_questions)
+    return len(joined), finished, answered, correct
+
+
 # ===================== 回合內 top 卡 =====================
 def render_top_card():
     r = st.session_state.round
@@ -509,23 +639,28 @@ def handle_action(qidx, submode_code, correct_answer, item, user_input):
         # 同時緩存到 answer_cache，方便重新rerun時保留
         st.session_state.answer_cache = student_answer
 
-    # 判斷正確與否 (模式三：不理大小寫 / 前後空白)
-    is_correct = (student_answer.lower() == correct_answer.lower())
+    is_correct = is_answer_correct(student_answer, correct_answer)
 
     # 如果還沒 submit -> 這次當成交卷
     if not st.session_state.submitted:
         st.session_state.submitted = True
 
         # 記錄
-        st.session_state.records.append((
+        rec = (
             st.session_state.round,           # 回合數
             prompt_for_record(qidx, submode_code),  # 題幹(中文或英文)
             student_answer,                   # 學生答
             correct_answer,                   # 正解
             is_correct,                       # bool
             (payload["display"] if (payload and "display" in payload) else None),
-            submode_code                      # 題型
-        ))
+            submode_code,                     # 題型
+            qidx                              # 題庫 index（錯題重練用）
+        )
+        append_records([rec])
+        if st.session_state.class_code:
+            report_class_answers({st.session_state.cur_idx_in_round: is_correct})
+        # 題目提交後的小複習：只在交卷時組一次，之後 rerun 直接顯示
+        st.session_state.last_review_md = build_answer_review_md(item, submode_code, rec[5])
 
         # 設定 feedback
         if is_correct:
@@ -565,55 +700,272 @@ def handle_action(qidx, submode_code, correct_answer, item, user_input):
         st.session_state.cur_idx_in_round += 1
         st.session_state.submitted = False
         st.session_state.last_feedback = ""
+        st.session_state.last_review_md = ""
         st.session_state.answer_cache = ""
 
         # 回合是否打完？
         if st.session_state.cur_idx_in_round >= len(st.session_state.cur_round_qidx):
-            # 回合完整結束
-            # 是否還可以下一回合？
-            if st.session_state.round < MAX_ROUNDS:
-                # 問要不要繼續
-                st.session_state.ask_continue = True
-            else:
-                # 第三回合打完，整個結束
-                st.session_state.quiz_done = True
-                st.session_state.round = None
+            finish_round()
 
         st.rerun()
         return
 
 
+def is_answer_correct(student_answer, correct_answer):
+    """判斷正確與否 (模式三：不理大小寫 / 前後空白)"""
+    return student_answer.strip().lower() == correct_answer.strip().lower()
+
+
+def finish_round():
+    """回合完整結束：是否還可以下一回合？（班級模式由老師決定回合數；round_limit=None 為無限練習）"""
+    limit = st.session_state.round_limit
+    if st.session_state.class_code or limit is None or st.session_state.round < limit:
+        # 問要不要繼續
+        st.session_state.ask_continue = True
+    else:
+        # 最後一回合打完，整個結束
+        finish_quiz()
+
+
+# ===================== 快速模式：整回合在瀏覽器作答 =====================
+_quiz_round_component = components.declare_component(
+    "quiz_round",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "quiz_round")
+)
+
+
+def build_client_round_payload(plan, round_no):
+    """
+    把本回合計畫打包成瀏覽器端用的精簡 payload（評分 / 換題都在前端做）。
+    回傳:
+    {
+        "plan_id": str,
+        "round": int,
+        "questions": [
+            {"kind": "mc"|"input", "text":..., "options": [...], "accept": [...], "feedback":...}, ...
+        ]
+    }
+    """
+    questions = []
+    for qidx, submode_code in zip(plan["qidx"], plan["submodes"]):
+        qtext, correct_answer, item, _ = build_question_prompt(qidx, submode_code)
+        if submode_code == "eng_to_chi_mc":
+            feedback = f"正確中文：{item['chinese'].strip()} （English: {item['english'].strip()}）"
+        else:
+            feedback = f"正確英文：{item['english'].strip()} （中文：{item['chinese'].strip()}）"
+        opts = plan["options"].get((qidx, submode_code), {"display": ()})["display"]
+        questions.append({
+            "kind": "mc" if opts else "input",
+            "text": qtext,
+            "options": list(opts),
+            "accept": [correct_answer],
+            "feedback": feedback,
+        })
+    return {"plan_id": plan["plan_id"], "round": round_no, "questions": questions}
+
+
+def apply_client_round_results(result):
+    """
+    收到瀏覽器送回的整回合答案：server 端重新評分後一次寫入 records / 資料庫 / 課堂統計。
+    result: {"plan_id": str, "answers": [str, ...]}
+    """
+    plan = st.session_state.round_plan
+    if not result or not plan or result.get("plan_id") != plan["plan_id"]:
+        return False
+    answers = list(result.get("answers") or [])
+
+    recs = []
+    class_results = {}
+    for pos, (qidx, submode_code) in enumerate(zip(plan["qidx"], plan["submodes"])):
+        _, correct_answer, item, _ = build_question_prompt(qidx, submode_code)
+        student_answer = str(answers[pos] if pos < len(answers) else "").strip()
+        is_correct = is_answer_correct(student_answer, correct_answer)
+        opts = plan["options"].get((qidx, submode_code))
+        recs.append((
+            st.session_state.round,
+            prompt_for_record(qidx, submode_code),
+            student_answer,
+            correct_answer,
+            is_correct,
+            (opts["display"] if opts else None),
+            submode_code,
+            qidx
+        ))
+        class_results[pos] = is_correct
+        st.session_state.used_keys.add(item["english"].strip())
+
+    append_records(recs)
+    if st.session_state.class_code:
+        report_class_answers(class_results)
+    st.session_state.score_this_round = sum(class_results.values())
+    st.session_state.cur_idx_in_round = len(plan["qidx"])
+    finish_round()
+    return True
+
+
+def render_client_round():
+    """快速模式的一整回合：只有開始和結束各跑一次 server"""
+    payload = st.session_state.client_round_payload
+    if payload is None or payload["plan_id"] != st.session_state.round_plan["plan_id"]:
+        # 保險：payload 不是本回合的就重新打包
+        payload = build_client_round_payload(st.session_state.round_plan, st.session_state.round)
+        st.session_state.client_round_payload = payload
+    result = _quiz_round_component(payload=payload, key=f"quiz_round_{payload['plan_id']}", default=None)
+    if apply_client_round_results(result):
+        st.rerun()
+
+
 # ===================== 回合結束：詢問是否繼續 =====================
+@st.fragment(run_every=3)
+def render_wait_for_next_class_round():
+    """每 3 秒檢查老師是否已發布下一回合（只重跑這個區塊，有變化才整頁重跑）"""
+    room = get_class_room(st.session_state.class_code)
+    if room is None or room["round"] > st.session_state.class_round:
+        st.rerun()
+    st.info("⏳ 等待老師發布下一回合…")
+
+
 def render_continue_prompt():
     st.subheader("本回合完成！")
     this_round_score = st.session_state.score_this_round
     this_round_total = len(st.session_state.cur_round_qidx)
     st.markdown(f"本回合成績：**{this_round_score} / {this_round_total}**")
 
-    st.write("是否繼續下一回合？（最多三回合）")
+    waiting = False
+    if st.session_state.class_code:
+        room = get_class_room(st.session_state.class_code)
+        if room is None:
+            # 老師已結束課堂，之後改成個人練習
+            st.session_state.class_code = ""
+            st.write("課堂已結束，是否繼續個人練習下一回合？")
+        elif room["round"] <= st.session_state.class_round:
+            # 等老師的同時也可以直接結束、看錯題
+            waiting = True
+            render_wait_for_next_class_round()
+        else:
+            st.write("老師已發布下一回合，是否繼續？")
+    else:
+        limit = st.session_state.round_limit
+        if limit is None:
+            st.write("是否繼續下一回合？（無限練習）")
+        else:
+            st.write(f"是否繼續下一回合？（最多 {limit} 回合）")
 
     col_yes, col_no = st.columns(2)
     with col_yes:
-        if st.button("Yes ▶ 下一回合"):
+        if not waiting and st.button("Yes ▶ 下一回合"):
             # 進入下一回合
             st.session_state.round += 1
             st.session_state.ask_continue = False
-            start_new_round()
+            if not (st.session_state.class_code and start_class_round()):
+                start_new_round()
             st.rerun()
     with col_no:
         if st.button("No ❌ 結束並檢視錯題"):
             st.session_state.ask_continue = False
-            st.session_state.quiz_done = True
-            st.session_state.round = None
-            st.session_state.show_wrong_review = True
+            finish_quiz(show_review=True)
             st.rerun()
 
 
 # ===================== 最後總結 + 錯題回顧 =====================
+SUBMODE_SHORT_LABEL = {
+    "eng_to_chi_mc": "英➜中 選擇",
+    "chi_to_eng_mc": "中➜英 選擇",
+    "chi_to_eng_input": "中➜英 手寫",
+}
+
+
+def build_review_tables(records):
+    """
+    由 records 組出錯題回顧用的表格（只在結束時算一次）。
+    records: (round, prompt, student_answer, correct_answer, is_correct, opts, submode_code, qidx)
+
+    回傳:
+    {
+        "by_term": DataFrame,   # 依單字彙整：錯幾次、哪幾回合、答過什麼
+        "detail": DataFrame,    # 每一筆錯題
+        "wrong_qidx": [qidx, ...]
+    }
+    """
+    by_term = {}
+    detail_rows = []
+    for rec in records:
+        rnd, prompt_txt, stu_ans, corr_ans, is_correct, _, submode_code, qidx = rec
+        if is_correct:
+            continue
+        detail_rows.append({
+            "#": len(detail_rows) + 1,
+            "回合": rnd,
+            "題型": SUBMODE_SHORT_LABEL.get(submode_code, submode_code),
+            "題目": prompt_txt,
+            "你的答案": stu_ans,
+            "正解": corr_ans,
+        })
+        if qidx not in by_term:
+            item = QUESTION_BANK[qidx]
+            by_term[qidx] = {
+                "English": item["english"].strip(),
+                "中文": item["chinese"].strip(),
+                "錯誤次數": 0,
+                "回合": [],
+                "你的答案": [],
+            }
+        row = by_term[qidx]
+        row["錯誤次數"] += 1
+        if rnd not in row["回合"]:
+            row["回合"].append(rnd)
+        if stu_ans and stu_ans not in row["你的答案"]:
+            row["你的答案"].append(stu_ans)
+
+    term_rows = sorted(by_term.values(), key=lambda r: -r["錯誤次數"])
+    for row in term_rows:
+        row["回合"] = ", ".join(str(r) for r in row["回合"])
+        row["你的答案"] = " / ".join(row["你的答案"])
+
+    return {
+        "by_term": pd.DataFrame(term_rows, columns=["English", "中文", "錯誤次數", "回合", "你的答案"]),
+        "detail": pd.DataFrame(detail_rows, columns=["#", "回合", "題型", "題目", "你的答案", "正解"]),
+        "wrong_qidx": list(by_term),
+    }
+
+
+def get_review_tables():
+    if st.session_state.review_tables is None:
+        st.session_state.review_tables = build_review_tables(st.session_state.records)
+    return st.session_state.review_tables
+
+
+def finish_quiz(show_review=False):
+    """整個遊戲結束：順便把錯題回顧表格算好"""
+    st.session_state.quiz_done = True
+    st.session_state.round = None
+    st.session_state.show_wrong_review = show_review
+    st.session_state.review_tables = build_review_tables(st.session_state.records)
+
+
+def start_retry_wrong_round():
+    """只用錯題開一個新回合（接在原本的紀錄後面）"""
+    wrong_qidx = get_review_tables()["wrong_qidx"]
+    records = st.session_state.records
+    st.session_state.round = (records[-1][0] if records else 0) + 1
+    st.session_state.quiz_done = False
+    st.session_state.show_wrong_review = False
+    st.session_state.review_tables = None
+    # 錯題重練是個人練習：離開班級課堂，不寫進課堂統計 / 課堂匯出
+    st.session_state.class_code = ""
+    st.session_state.class_room_id = ""
+    st.session_state.class_round = 0
+    start_new_round(plan=build_round_plan(
+        st.session_state.chosen_mode_label,
+        n_questions=len(wrong_qidx),
+        pool=wrong_qidx
+    ))
+
+
 def render_final_summary():
-    # 計算總成績
-    total_answered = len(st.session_state.records)
-    total_correct = sum(1 for rec in st.session_state.records if rec[4])
+    # 計算總成績（累計統計，不受 records 保留筆數影響）
+    total_answered = st.session_state.stats["answered"]
+    total_correct = st.session_state.stats["correct"]
     acc = (total_correct / total_answered * 100) if total_answered else 0.0
 
     st.subheader("📊 總結")
@@ -621,53 +973,54 @@ def render_final_summary():
     st.markdown(f"<h3>Total Correct: {total_correct}</h3>", unsafe_allow_html=True)
     st.markdown(f"<h3>Accuracy: {acc:.1f}%</h3>", unsafe_allow_html=True)
 
-    wrong_list = [r for r in st.session_state.records if not r[4]]
-    if wrong_list:
+    if get_review_tables()["wrong_qidx"]:
         # 顯示一個按鈕才能打開錯題，避免一開始太多文字
-        if st.button("📚 顯示本次錯題回顧"):
+        if not st.session_state.show_wrong_review and st.button("📚 顯示本次錯題回顧"):
             st.session_state.show_wrong_review = True
             st.rerun()
+        if st.button("🔁 只練錯題（新回合）"):
+            start_retry_wrong_round()
+            st.rerun()
     else:
         st.info("恭喜！沒有錯題 🎉")
 
     # 再玩一次 / 回到模式選擇
     st.markdown("---")
-    if st.button("🔄 再玩一次（同模式）"):
+    room = get_class_room(st.session_state.class_code) if st.session_state.class_code else None
+    if room is not None and room["round"] <= st.session_state.class_round:
+        # 課堂這一回合已經做完：等老師發布下一回合，不重做同一回合
+        render_wait_for_next_class_round()
+    elif st.button("🔄 再玩一次（同模式）"):
         init_quiz_state()
-        start_new_round()
+        if not (st.session_state.class_code and start_class_round()):
+            st.session_state.class_code = ""
+            start_new_round()
         st.session_state.mode_locked = True
         st.rerun()
 
     if st.button("🧪 選別的模式"):
         st.session_state.mode_locked = False
         st.session_state.chosen_mode_label = None
+        st.session_state.class_code = ""
         init_quiz_state()
         st.rerun()
 
 
 def render_wrong_review():
-    wrong_list = [r for r in st.session_state.records if not r[4]]
-    if not wrong_list:
+    tables = get_review_tables()
+    if not tables["wrong_qidx"]:
         st.info("沒有錯題 🎉")
         return
 
     st.subheader("❌ 錯題回顧")
-    # records: (round, prompt, student_answer, correct_answer, is_correct, opts, submode_code)
-    for idx, rec in enumerate(wrong_list, start=1):
-        rnd, prompt_txt, stu_ans, corr_ans, _, _, submode_code = rec
-        st.markdown(f"**#{idx} (回合 {rnd})**")
-        if submode_code == "eng_to_chi_mc":
-            # prompt_txt 是 English 單字
-            st.write(f"英文題目：{prompt_txt}")
-            st.write(f"你的中文答案：{stu_ans}")
-            st.write(f"正確中文：{corr_ans}")
-        else:
-            # chi_to_eng_mc / chi_to_eng_input
-            # prompt_txt 是 中文詞
-            st.write(f"中文題目：{prompt_txt}")
-            st.write(f"你的英文答案：{stu_ans}")
-            st.write(f"正確英文：{corr_ans}")
-        st.markdown("---")
+    if st.session_state.stats["answered"] > len(st.session_state.records):
+        st.caption(f"只顯示最近 {RECORDS_HISTORY_LIMIT} 題裡的錯題。")
+
+    # 依單字彙整，一個表格搞定（不管錯幾題都只有一個元素）
+    st.dataframe(tables["by_term"], hide_index=True, width="stretch")
+
+    with st.expander(f"每一題明細（共 {len(tables['detail'])} 題）"):
+        st.dataframe(tables["detail"], hide_index=True, width="stretch")
 
 
 # ===================== Page A：模式選擇 =====================
@@ -682,17 +1035,160 @@ def render_mode_select_page():
         key="mode_pick_for_start"
     )
 
+    col_n, col_rounds = st.columns(2)
+    with col_n:
+        n_questions = st.number_input(
+            "每回合題數",
+            min_value=1,
+            max_value=len(QUESTION_BANK),
+            value=min(st.session_state.questions_per_round, len(QUESTION_BANK)),
+            step=1,
+            key="questions_per_round_pick"
+        )
+    with col_rounds:
+        round_limit = st.selectbox(
+            "回合數",
+            ROUND_LIMIT_CHOICES,
+            index=ROUND_LIMIT_CHOICES.index(st.session_state.round_limit or 0),
+            format_func=lambda v: f"{v} 回合" if v else "♾ 無限練習",
+            key="round_limit_pick"
+        )
 
+    client_side = st.checkbox(
+        "⚡ 快速模式（整回合在瀏覽器作答，結束後一次上傳成績）",
+        value=st.session_state.client_side_rounds,
+        key="client_side_pick"
+    )
+    st.session_state.client_side_rounds = client_side
 
     if st.button("開始作答 ▶"):
         # 鎖模式
         st.session_state.chosen_mode_label = chosen
         st.session_state.mode_locked = True
+        st.session_state.class_code = ""
+        st.session_state.questions_per_round = int(n_questions)
+        st.session_state.round_limit = round_limit or None
         init_quiz_state()
         st.session_state.chosen_mode_label = chosen
         start_new_round()
         st.rerun()
 
+    st.markdown("---")
+    with st.expander("🏫 學生：加入班級課堂"):
+        code = st.text_input("課堂代碼", key="class_code_input", placeholder="老師給的 4 位數代碼")
+        if st.button("加入課堂 ▶"):
+            room = get_class_room(code)
+            if room is None:
+                st.warning("找不到這個課堂代碼。")
+            else:
+                init_quiz_state()
+                st.session_state.chosen_mode_label = room["mode_label"]
+                st.session_state.class_code = room["code"]
+                st.session_state.mode_locked = True
+                start_class_round()
+                st.rerun()
+
+    with st.expander("👩‍🏫 老師：開設班級課堂"):
+        st.write("全班使用同一份題目（目前選擇的模式），方便一起討論。")
+        if st.button("開設課堂 ▶"):
+            st.session_state.teacher_room_code = create_class_room(chosen, int(n_questions))
+            st.rerun()
+
+
+# ===================== Page T：老師課堂頁 =====================
+@st.fragment(run_every=2)
+def render_class_live_results(code):
+    """每 2 秒自動更新全班即時成績（只重跑這個區塊）"""
+    room = get_class_room(code)
+    if room is None:
+        st.warning("課堂已結束。")
+        return
+
+    n_joined, n_finished, answered, correct = class_round_stats(room)
+    st.markdown(f"第 {room['round']} 回合｜已加入：**{n_joined}** 人｜已完成：**{n_finished}** 人")
+
+    plan = room["plan"]
+    rows = []
+    for pos, (qidx, submode_code) in enumerate(zip(plan["qidx"], plan["submodes"])):
+        qtext, correct_answer, _, _ = build_question_prompt(qidx, submode_code)
+        acc = (correct[pos] / answered[pos] * 100) if answered[pos] else 0.0
+        rows.append({
+            "題號": f"Q{pos + 1}",
+            "題目": qtext,
+            "正解": correct_answer,
+            "作答人數": answered[pos],
+            "答對人數": correct[pos],
+            "正確率(%)": round(acc, 1),
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True, width="stretch")
+
+
+def render_teacher_page():
+    code = st.session_state.teacher_room_code
+    room = get_class_room(code)
+    if room is None:
+        st.session_state.teacher_room_code = ""
+        st.rerun()
+
+    st.markdown(f"## 🏫 班級課堂代碼：{code}")
+    st.write(f"模式：{room['mode_label']}")
+    st.write("請學生在首頁「加入班級課堂」輸入上面的代碼。")
+
+    render_class_live_results(code)
+
+    st.markdown("---")
+    col_next, col_close = st.columns(2)
+    with col_next:
+        if st.button("▶ 發布下一回合（全班）"):
+            publish_next_class_round(code)
+            st.rerun()
+    with col_close:
+        if st.button("⏹ 結束課堂"):
+            close_class_room(code)
+            st.session_state.teacher_room_code = ""
+            st.rerun()
+
+    render_export_panel(room)
+
+
+def render_export_panel(room):
+    """
+    老師匯出本課堂成績（只限這個 room_id）。
+    這一頁沒有登入，跨班級 / 日期區間的匯出只能在 server 上用命令列做。
+    用另一條唯讀連線串流寫到暫存檔，不拿寫入 lock，學生交卷不會被擋住。
+    下載按鈕要把整個檔案載入記憶體，所以超過 APP_EXPORT_MAX_ROWS 筆請改用命令列。
+    """
+    with st.expander("📥 匯出本課堂成績（Excel / CSV）"):
+        filters = {"room_id": room["room_id"]}
+        fmt = st.radio("格式", ["xlsx", "csv"], key="export_fmt", horizontal=True)
+        st.caption(
+            f"網頁下載最多 {APP_EXPORT_MAX_ROWS} 筆；班級 / 日期區間等大量資料請在 server 上執行 "
+            "`python puzzleU46_results.py --out 檔名.xlsx ...`。"
+        )
+
+        if st.button("產生檔案"):
+            get_results_db()  # 確保資料庫已建立
+            conn = open_results_db_readonly(DEFAULT_DB_PATH)
+            try:
+                count = count_results(conn, **filters)
+                if count > APP_EXPORT_MAX_ROWS:
+                    st.warning(f"共 {count} 筆，超過網頁下載上限，請改用命令列匯出。")
+                    return
+                fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+                os.close(fd)
+                count = export_results(conn, path, fmt=fmt, **filters)
+            finally:
+                conn.close()
+            with open(path, "rb") as f:
+                data = f.read()
+            os.remove(path)
+            st.write(f"共 {count} 筆。")
+            st.download_button(
+                "⬇ 下載",
+                data,
+                file_name=f"puzzleU46_results_{datetime.date.today():%Y%m%d}.{fmt}",
+            )
+
 
 # ===================== Page B：測驗頁 =====================
 def render_quiz_page():
@@ -707,9 +1203,13 @@ def render_quiz_page():
         st.write("模式已鎖定：")
         st.write(st.session_state.chosen_mode_label)
 
+        if st.session_state.class_code:
+            st.write(f"🏫 班級課堂：{st.session_state.class_code}")
+
         if st.button("🔄 重新開始（重新選模式）"):
             st.session_state.mode_locked = False
             st.session_state.chosen_mode_label = None
+            st.session_state.class_code = ""
             init_quiz_state()
             st.rerun()
 
@@ -727,6 +1227,11 @@ def render_quiz_page():
         render_continue_prompt()
         return
 
+    # 快速模式：整回合交給瀏覽器
+    if st.session_state.round and st.session_state.client_side_rounds:
+        render_client_round()
+        return
+
     # 回合中 (normal question flow)
     if st.session_state.round:
         render_top_card()
@@ -741,53 +1246,26 @@ def render_quiz_page():
         if st.button(label_now, key="action_btn"):
             handle_action(qidx, submode_code, correct_answer, item, user_input)
 
-        # 題目提交後的小複習
-        if st.session_state.submitted and st.session_state.records:
-            last = st.session_state.records[-1]
-            # last: (round, prompt_txt, stu_ans, correct_answer, is_correct, opts, submode_code)
-            _, prompt_txt, _, corr, _, opts_disp, last_mode = last
-
+        # 題目提交後的小複習（交卷時已組好）
+        if st.session_state.submitted and st.session_state.last_review_md:
             st.markdown("---")
-            if last_mode == "eng_to_chi_mc":
-                # prompt_txt 是英文，corr 是正確中文
-                st.markdown(
-                    f"**正確中文：{item['chinese'].strip()}** "
-                    f"(English: {item['english'].strip()})"
-                )
-            else:
-                # chi_to_eng_mc / chi_to_eng_input
-                st.markdown(
-                    f"**正確英文：{item['english'].strip()}** "
-                    f"(中文：{item['chinese'].strip()})"
-                )
-
-            # 顯示本題兩個選項（若是選擇題）
-            if last_mode in ["eng_to_chi_mc", "chi_to_eng_mc"] and opts_disp:
-                st.markdown("**本題兩個選項：**")
-                nice_list = []
-                for opt in opts_disp:
-                    opt_clean = opt.strip().lower()
-                    match_item = None
-                    for it in QUESTION_BANK:
-                        if it["english"].strip().lower() == opt_clean or it["chinese"].strip() == opt.strip():
-                            match_item = it
-                            break
-                    if match_item:
-                        nice_list.append(
-                            f"{match_item['english'].strip()} / {match_item['chinese'].strip()}"
-                        )
-                    else:
-                        nice_list.append(opt.strip())
-                st.markdown("、".join(nice_list))
+            st.markdown(st.session_state.last_review_md)
 
     else:
         # 理論上不應該到這（round=None 但 quiz_done=False 情況少見）
-        st.session_state.quiz_done = True
+        finish_quiz()
         st.rerun()
 
 
 # ===================== Router =====================
-if not st.session_state.mode_locked:
+ensure_state_ready()
+if st.session_state.mode_locked and st.session_state.round and not st.session_state.cur_round_qidx:
+    # first entry into quiz page after picking mode
+    start_new_round()
+
+if st.session_state.teacher_room_code:
+    render_teacher_page()
+elif not st.session_state.mode_locked:
     render_mode_select_page()
 else:
     render_quiz_page()
@@ -0,0 +1,219 @@
+"""
+題庫讀取 + 出題邏輯（不依賴 Streamlit）。
+網頁 App（puzzleU46.py）和講義產生器（worksheetU46.py）共用同一套規則。
+"""
+import random
+import uuid
+
+import pandas as pd
+
+
+# 模式四（混合）會用到的子模式
+SUBMODE_LIST_FOR_MIX = [
+    "eng_to_chi_mc",
+    "chi_to_eng_mc",
+    "chi_to_eng_input"
+]
+
+MC_SUBMODES = ["eng_to_chi_mc", "chi_to_eng_mc"]
+
+
+# ===================== 題庫讀取：English / Chinese 兩欄 =====================
+def read_question_bank(xlsx_path="puzzleU46.xlsx"):
+    """
+    自動對應：
+      english_col ← ["english","英文","term","英文名","en","english term"]
+      chinese_col ← ["chinese","中文","名稱","name","cn","chinese name","中文名"]
+
+    回傳:
+    {
+        "ok": bool,
+        "error": str,
+        "bank": [ { "english":..., "chinese":...}, ... ],
+        "debug_cols": [...]
+    }
+    """
+    try:
+        df = pd.read_excel(xlsx_path)
+    except Exception as e:
+        return {
+            "ok": False,
+            "error": f"無法讀取題庫檔案 {xlsx_path} ：{e}",
+            "bank": [],
+            "debug_cols": []
+        }
+
+    def norm(s):
+        return str(s).strip().lower()
+
+    cols_norm = {norm(c): c for c in df.columns}
+
+    eng_candidates = [
+        "english","英文","term","英文名","en","english term"
+    ]
+    chi_candidates = [
+        "chinese","中文","名稱","name","cn","chinese name","中文名"
+    ]
+
+    def pick_col(cands):
+        for cand in cands:
+            if cand in cols_norm:
+                return cols_norm[cand]
+        return None
+
+    eng_col = pick_col(eng_candidates)
+    chi_col = pick_col(chi_candidates)
+
+    if eng_col is None or chi_col is None:
+        return {
+            "ok": False,
+            "error": (
+                "找不到必要欄位。\n"
+                f"檔案欄位：{list(df.columns)}\n"
+                f"English 欄候選：{eng_candidates}\n"
+                f"Chinese 欄候選：{chi_candidates}\n"
+                "請把 Excel 欄位命名成其中一個候選名稱（如 English / Chinese）。"
+            ),
+            "bank": [],
+            "debug_cols": list(df.columns)
+        }
+
+    def clean(v):
+        if pd.isna(v):
+            return ""
+        return str(v).strip()
+
+    bank_list = []
+    for _, row in df.iterrows():
+        en = clean(row.get(eng_col, ""))
+        ch = clean(row.get(chi_col, ""))
+        if en and ch:
+            bank_list.append({"english": en, "chinese": ch})
+
+    return {
+        "ok": True,
+        "error": "",
+        "bank": bank_list,
+        "debug_cols": list(df.columns)
+    }
+
+
+# ===================== 出題 =====================
+def make_options(bank, qidx, submode_code, rng=random):
+    """
+    submode_code:
+      eng_to_chi_mc    題幹 English，選 Chinese
+      chi_to_eng_mc    題幹 Chinese，選 English
+      chi_to_eng_input 手寫 => 不用選項
+    回傳: [...兩個選項字串...]  (手寫模式回傳 [])
+    """
+    item = bank[qidx]
+    correct_en = item["english"].strip()
+    correct_ch = item["chinese"].strip()
+
+    if submode_code == "eng_to_chi_mc":
+        # 正解 = 中文
+        pool_ch = [it["chinese"].strip() for it in bank
+                   if it["chinese"].strip() != correct_ch]
+        distractor = rng.choice(pool_ch) if pool_ch else "???"
+        opts = [correct_ch, distractor]
+
+    elif submode_code == "chi_to_eng_mc":
+        # 正解 = English
+        pool_en = [it["english"].strip() for it in bank
+                   if it["english"].strip().lower() != correct_en.lower()]
+        distractor = rng.choice(pool_en) if pool_en else "???"
+        opts = [correct_en, distractor]
+
+    else:
+        # 手寫模式不需要選項
+        return []
+
+    rng.shuffle(opts)
+    return opts
+
+
+def build_item_prompt(item, submode_code):
+    """回傳 (題目文字, 正解(英/中), 額外提示(模式三))"""
+    en = item["english"].strip()
+    ch = item["chinese"].strip()
+
+    if submode_code == "eng_to_chi_mc":
+        # 給英文，問中文
+        prompt_txt = en
+        question_text = f'「{prompt_txt}」對應的正確中文是？'
+        correct_answer = ch
+        hint = ""
+    elif submode_code == "chi_to_eng_mc":
+        # 給中文，問英文 (選擇)
+        prompt_txt = ch
+        question_text = f'「{prompt_txt}」的正確英文是？'
+        correct_answer = en
+        hint = ""
+    else:
+        # chi_to_eng_input：給中文，手寫英文
+        prompt_txt = ch
+        # 提示：英文首尾字母
+        if len(en) >= 2:
+            hint = f"(提示: {en[0]} ... {en[-1]})"
+        else:
+            hint = f"(提示: {en})"
+        question_text = f'「{prompt_txt}」的正確英文是？ {hint}'
+        correct_answer = en
+
+    return question_text, correct_answer, hint
+
+
+def build_round_plan(bank, submode_code, n_questions, used_keys=(), rng=random, pool=None):
+    """
+    預先算好一回合的題目計畫：題目 index、每題子模式、選擇題選項。
+    submode_code=None 表示混合模式（每題隨機子模式）。
+    pool: 只從這些題目 index 裡抽（例如只練錯題）；None = 整個題庫。
+    回傳的內容只用 tuple / dict 存放，班級模式下全班共用同一份，不可修改。
+    傳入 random.Random(seed) 當 rng 就能重現同一份計畫。
+
+    回傳:
+    {
+        "plan_id": str,
+        "qidx": (qidx, ...),
+        "submodes": (submode_code, ...),    # 與 qidx 對齊
+        "options": { (qidx, submode_code): {"display": (...兩個選項...)} }
+    }
+    """
+    if pool is None:
+        pool = range(len(bank))
+
+    # 避免重複：以 english 當 key
+    remaining = [
+        i for i in pool
+        if bank[i]["english"] not in used_keys
+    ]
+    # 如果都用光了，就從整個 pool 抽
+    if not remaining:
+        remaining = list(pool)
+
+    # 抽題
+    if len(remaining) <= n_questions:
+        chosen = remaining[:]
+        rng.shuffle(chosen)
+    else:
+        chosen = rng.sample(remaining, n_questions)
+
+    # 產生每題子模式
+    if submode_code is None:
+        submodes = [rng.choice(SUBMODE_LIST_FOR_MIX) for _ in chosen]
+    else:
+        submodes = [submode_code for _ in chosen]
+
+    # 選擇題選項一次算好
+    options = {}
+    for qidx, code in zip(chosen, submodes):
+        if code in MC_SUBMODES:
+            options[(qidx, code)] = {"display": tuple(make_options(bank, qidx, code, rng))}
+
+    return {
+        "plan_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "qidx": tuple(chosen),
+        "submodes": tuple(submodes),
+        "options": options,
+    }
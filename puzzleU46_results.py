@@ -0,0 +1,245 @@
+"""
+作答紀錄保存 + 大量匯出（不依賴 Streamlit）。
+
+每一題作答都寫進 SQLite（puzzleU46_results.db）。匯出時用分批查詢
+(fetchmany) 一批一批讀出，再用 openpyxl write-only 模式或 csv 逐列寫檔，
+整學期、上百位學生的資料也只占固定的記憶體。
+
+命令列用法:
+    python puzzleU46_results.py --class 801 --since 2026-09-01 --until 2027-01-20 \\
+        --out results_801.xlsx
+"""
+import argparse
+import csv
+import datetime
+import os
+import pathlib
+import sqlite3
+import sys
+
+from openpyxl import Workbook
+
+DEFAULT_DB_PATH = "puzzleU46_results.db"
+EXPORT_CHUNK_SIZE = 1000
+
+# (欄位名, 匯出表頭)
+RESULT_COLUMNS = [
+    ("ts", "時間"),
+    ("session_id", "Session"),
+    ("class_code", "課堂代碼"),
+    ("room_id", "課堂ID"),
+    ("user_name", "姓名"),
+    ("user_class", "班級"),
+    ("user_seat", "座號"),
+    ("round", "回合"),
+    ("submode", "題型"),
+    ("prompt", "題目"),
+    ("student_answer", "學生答案"),
+    ("correct_answer", "正解"),
+    ("is_correct", "是否答對"),
+]
+
+
+# ===================== 寫入 =====================
+def open_results_db(db_path=DEFAULT_DB_PATH):
+    """開啟（必要時建立）紀錄資料庫（寫入用）；連線可跨 thread 使用，呼叫端自己加 lock"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            class_code TEXT NOT NULL DEFAULT '',
+            room_id TEXT NOT NULL DEFAULT '',
+            user_name TEXT NOT NULL DEFAULT '',
+            user_class TEXT NOT NULL DEFAULT '',
+            user_seat TEXT NOT NULL DEFAULT '',
+            round INTEGER,
+            submode TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            student_answer TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            is_correct INTEGER NOT NULL
+        )
+    """)
+    # 舊版資料庫沒有 room_id 欄位
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(answers)")}
+    if "room_id" not in cols:
+        conn.execute("ALTER TABLE answers ADD COLUMN room_id TEXT NOT NULL DEFAULT ''")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_ts ON answers (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_session ON answers (session_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_class ON answers (user_class, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_room ON answers (class_code)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_room_id ON answers (room_id)")
+    conn.commit()
+    return conn
+
+
+def open_results_db_readonly(db_path=DEFAULT_DB_PATH):
+    """
+    匯出用的唯讀連線。資料庫是 WAL 模式，讀的時候不會擋住寫入，
+    所以匯出不要共用寫入連線、也不要拿寫入用的 lock。
+    """
+    uri = pathlib.Path(db_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+def save_answers(conn, rows):
+    """
+    rows: [ {"session_id", "class_code", "room_id", "user_name", "user_class", "user_seat",
+             "round", "submode", "prompt", "student_answer", "correct_answer",
+             "is_correct"}, ... ]
+    ts 沒給就用現在時間。
+    """
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    names = [name for name, _ in RESULT_COLUMNS]
+    conn.executemany(
+        f"INSERT INTO answers ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+        [
+            tuple(
+                (row.get("ts") or now) if name == "ts"
+                else int(bool(row["is_correct"])) if name == "is_correct"
+                else row.get(name, "")
+                for name in names
+            )
+            for row in rows
+        ],
+    )
+    conn.commit()
+
+
+# ===================== 查詢 / 匯出 =====================
+def _where_clause(session_id=None, room_id=None, class_code=None, user_class=None,
+                  since=None, until=None):
+    """
+    since / until 是 datetime.date，until 當天也包含在內。
+    class_code 是 4 位數代碼，課堂結束後會被重複使用；要指定「某一堂課」請用 room_id。
+    """
+    conds, params = [], []
+    if session_id:
+        conds.append("session_id = ?")
+        params.append(session_id)
+    if room_id:
+        conds.append("room_id = ?")
+        params.append(room_id)
+    if class_code:
+        conds.append("class_code = ?")
+        params.append(class_code)
+    if user_class:
+        conds.append("user_class = ?")
+        params.append(user_class)
+    if since:
+        conds.append("ts >= ?")
+        params.append(since.strftime("%Y-%m-%d"))
+    if until:
+        conds.append("ts < ?")
+        params.append((until + datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+    where = (" WHERE " + " AND ".join(conds)) if conds else ""
+    return where, params
+
+
+def count_results(conn, **filters):
+    """符合條件的筆數"""
+    where, params = _where_clause(**filters)
+    return conn.execute(f"SELECT COUNT(*) FROM answers{where}", params).fetchone()[0]
+
+
+def iter_results(conn, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """依條件一批一批讀出紀錄（tuple，欄位順序同 RESULT_COLUMNS）"""
+    where, params = _where_clause(**filters)
+    names = ", ".join(name for name, _ in RESULT_COLUMNS)
+    cur = conn.execute(f"SELECT {names} FROM answers{where} ORDER BY id", params)
+    try:
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                yield row
+    finally:
+        cur.close()
+
+
+def export_results(conn, out_path, fmt=None, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """
+    把符合條件的紀錄串流寫到 out_path（.xlsx 或 .csv），回傳寫出的筆數。
+    fmt 沒給就看副檔名。
+    """
+    fmt = fmt or ("csv" if str(out_path).lower().endswith(".csv") else "xlsx")
+    header = [label for _, label in RESULT_COLUMNS]
+    correct_col = [name for name, _ in RESULT_COLUMNS].index("is_correct")
+
+    def rows():
+        for row in iter_results(conn, chunk_size=chunk_size, **filters):
+            row = list(row)
+            row[correct_col] = "O" if row[correct_col] else "X"
+            yield row
+
+    count = 0
+    if fmt == "csv":
+        # utf-8-sig：Excel 直接開也不會亂碼
+        with open(out_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for row in rows():
+                writer.writerow(row)
+                count += 1
+    else:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("作答紀錄")
+        ws.append(header)
+        for row in rows():
+            ws.append(row)
+            count += 1
+        wb.save(out_path)
+    return count
+
+
+# ===================== CLI =====================
+def _parse_date(s):
+    return datetime.datetime.strptime(s, "%Y-%m-%d").date()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="匯出作答紀錄（XLSX / CSV）")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="紀錄資料庫路徑")
+    parser.add_argument("--out", required=True, help="輸出檔（.xlsx 或 .csv）")
+    parser.add_argument("--session", dest="session_id", help="只匯出某個 session")
+    parser.add_argument("--room-id", dest="room_id", help="只匯出某一堂課（課堂ID）")
+    parser.add_argument("--room", dest="class_code",
+                        help="只匯出某個課堂代碼（代碼會重複使用，可能包含不同堂課）")
+    parser.add_argument("--class", dest="user_class", help="只匯出某個班級（學生填的班級）")
+    parser.add_argument("--since", type=_parse_date, help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--until", type=_parse_date, help="結束日期 YYYY-MM-DD（含當天）")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE,
+                        help="每批查詢筆數")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.db):
+        print(f"找不到紀錄資料庫 {args.db}", file=sys.stderr)
+        return 1
+    conn = open_results_db_readonly(args.db)
+    try:
+        count = export_results(
+            conn,
+            args.out,
+            chunk_size=args.chunk_size,
+            session_id=args.session_id,
+            room_id=args.room_id,
+            class_code=args.class_code,
+            user_class=args.user_class,
+            since=args.since,
+            until=args.until,
+        )
+    finally:
+        conn.close()
+    print(f"匯出 {count} 筆 → {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+講義 / 解答批次產生器（命令列）。
+
+用和網頁 App 相同的題庫與三種子模式，一次產生大量「不同、可重現」的練習卷
+與解答，輸出 HTML 和/或 XLSX。每一份卷子用 "seed:編號" 當亂數種子，
+由 process pool 平行產生，每個 worker 直接把檔案串流寫進輸出資料夾。
+
+用法:
+    python worksheetU46.py --count 2000 --questions 20 --mode 4 --seed 46 \\
+        --format html xlsx --out worksheets
+"""
+import argparse
+import hashlib
+import html
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import Workbook
+
+from puzzleU46_bank import build_item_prompt, build_round_plan, read_question_bank
+
+MODE_CHOICES = {
+    "1": "eng_to_chi_mc",       # English ➜ 中文 (單選)
+    "2": "chi_to_eng_mc",       # 中文 ➜ English (單選)
+    "3": "chi_to_eng_input",    # 中文 ➜ English (手寫，提示首尾)
+    "4": None,                  # 混合 (1~3)
+}
+
+OPTION_LETTERS = "ABCDEFGH"
+
+
+# ===================== 出一份卷子 =====================
+def build_worksheet(bank, sheet_no, seed, n_questions, submode_code):
+    """
+    回傳:
+    {
+        "sheet_no": int,
+        "seed": str,            # "seed:編號"
+        "questions": [
+            {"text":..., "options": [...], "answer":..., "answer_label":...}, ...
+        ]
+    }
+    """
+    rng = random.Random(seed)
+    plan = build_round_plan(bank, submode_code, n_questions, rng=rng)
+
+    questions = []
+    for qidx, code in zip(plan["qidx"], plan["submodes"]):
+        question_text, correct_answer, _ = build_item_prompt(bank[qidx], code)
+        opts = list(plan["options"].get((qidx, code), {"display": ()})["display"])
+        if opts:
+            letter = OPTION_LETTERS[opts.index(correct_answer)]
+            answer_label = f"({letter}) {correct_answer}"
+        else:
+            answer_label = correct_answer
+        questions.append({
+            "text": question_text,
+            "options": opts,
+            "answer": correct_answer,
+            "answer_label": answer_label,
+        })
+
+    return {"sheet_no": sheet_no, "seed": seed, "questions": questions}
+
+
+def sheet_seed(seed, sheet_no):
+    """
+    第 sheet_no 份卷子的亂數種子。用 "seed:編號" 字串而不是 seed + 編號，
+    這樣 --seed 46 的第 2 份和 --seed 47 的第 1 份不會是同一份卷子。
+    """
+    return f"{seed}:{sheet_no}"
+
+
+def sheet_signature(sheet):
+    """題目 + 選項順序的指紋，用來檢查有沒有重複的卷子"""
+    h = hashlib.sha1()
+    for q in sheet["questions"]:
+        h.update(q["text"].encode("utf-8"))
+        for opt in q["options"]:
+            h.update(b"\x1f" + opt.encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+# ===================== 輸出 =====================
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 16px; margin: 2em; }}
+h1 {{ font-size: 22px; margin-bottom: 0.2em; }}
+.info {{ margin-bottom: 1em; }}
+ol li {{ margin-bottom: 0.8em; }}
+.opts span {{ margin-right: 2em; }}
+.blank {{ display: inline-block; width: 14em; border-bottom: 1px solid #000; }}
+</style>
+</head>
+<body>
+"""
+
+
+def write_html(sheet, path, title, answer_key=False):
+    """一題一題寫出去，不先組成整份字串"""
+    with open(path, "w", encoding="utf-8") as f:
+        heading = f"{title} #{sheet['sheet_no']:05d}" + ("（解答）" if answer_key else "")
+        f.write(HTML_HEAD.format(title=html.escape(heading)))
+        f.write(f"<h1>{html.escape(heading)}</h1>\n")
+        if not answer_key:
+            f.write("<div class='info'>姓名：________　班級：______　座號：____</div>\n")
+        f.write("<ol>\n")
+        for q in sheet["questions"]:
+            f.write(f"<li>{html.escape(q['text'])}")
+            if answer_key:
+                f.write(f"<br><b>{html.escape(q['answer_label'])}</b>")
+            elif q["options"]:
+                f.write("<div class='opts'>")
+                for letter, opt in zip(OPTION_LETTERS, q["options"]):
+                    f.write(f"<span>({letter}) {html.escape(opt)}</span>")
+                f.write("</div>")
+            else:
+                f.write("<br><span class='blank'>&nbsp;</span>")
+            f.write("</li>\n")
+        f.write(f"</ol>\n<!-- seed: {sheet['seed']} -->\n</body>\n</html>\n")
+
+
+def write_xlsx(sheet, path, title, answer_key=False):
+    """write-only 模式逐列寫入；題目卷和解答分成兩個檔案，和 HTML 一樣"""
+    wb = Workbook(write_only=True)
+
+    if answer_key:
+        ws = wb.create_sheet("解答")
+        ws.append([f"{title} #{sheet['sheet_no']:05d}（解答）"])
+        ws.append(["題號", "題目", "正解", "seed"])
+        for no, q in enumerate(sheet["questions"], start=1):
+            ws.append([no, q["text"], q["answer_label"], sheet["seed"]])
+    else:
+        ws = wb.create_sheet("題目")
+        ws.append([f"{title} #{sheet['sheet_no']:05d}"])
+        ws.append(["姓名：", "", "班級：", "", "座號："])
+        ws.append(["題號", "題目", "選項", "作答"])
+        for no, q in enumerate(sheet["questions"], start=1):
+            opts = "　".join(f"({l}) {o}" for l, o in zip(OPTION_LETTERS, q["options"]))
+            ws.append([no, q["text"], opts, ""])
+
+    wb.save(path)
+
+
+# ===================== process pool worker =====================
+_WORKER = {}
+
+
+def _init_worker(bank, options):
+    """每個 worker process 只收一次題庫與設定，不必每份卷子重傳"""
+    _WORKER["bank"] = bank
+    _WORKER["options"] = options
+
+
+def _make_one(sheet_no):
+    """產生第 sheet_no 份卷子並寫檔，回傳 (編號, 指紋)"""
+    bank = _WORKER["bank"]
+    opt = _WORKER["options"]
+    sheet = build_worksheet(
+        bank, sheet_no, sheet_seed(opt["seed"], sheet_no), opt["questions"], opt["submode_code"]
+    )
+    stem = os.path.join(opt["out"], f"ws_{sheet_no:05d}")
+    if "html" in opt["formats"]:
+        write_html(sheet, stem + ".html", opt["title"])
+        write_html(sheet, stem + "_key.html", opt["title"], answer_key=True)
+    if "xlsx" in opt["formats"]:
+        write_xlsx(sheet, stem + ".xlsx", opt["title"])
+        write_xlsx(sheet, stem + "_key.xlsx", opt["title"], answer_key=True)
+    return sheet_no, sheet_signature(sheet)
+
+
+# ===================== CLI =====================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批次產生練習卷與解答（HTML / XLSX）")
+    parser.add_argument("--bank", default="puzzleU46.xlsx", help="題庫 Excel 路徑")
+    parser.add_argument("--count", type=int, default=40, help="要產生幾份卷子")
+    parser.add_argument("--questions", type=int, default=20, help="每份卷子的題數")
+    parser.add_argument("--mode", choices=sorted(MODE_CHOICES), default="4",
+                        help="1=English➜中文 2=中文➜English 3=手寫(提示首尾) 4=混合")
+    parser.add_argument("--seed", type=int, default=46, help="基本亂數種子（第 i 份用 \"seed:i\"，不同 seed 的卷子不會重疊）")
+    parser.add_argument("--format", nargs="+", choices=["html", "xlsx"], default=["html"],
+                        dest="formats", help="輸出格式，可同時指定")
+    parser.add_argument("--out", default="worksheets", help="輸出資料夾")
+    parser.add_argument("--title", default="Puzzle for U4~U6", help="卷子標題")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="process 數量（預設為 CPU 數）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    loaded = read_question_bank(args.bank)
+    if not loaded["ok"] or not loaded["bank"]:
+        print(loaded["error"] or "題庫為空。", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.out, exist_ok=True)
+    options = {
+        "seed": args.seed,
+        "questions": args.questions,
+        "submode_code": MODE_CHOICES[args.mode],
+        "out": args.out,
+        "formats": args.formats,
+        "title": args.title,
+    }
+
+    workers = args.workers or os.cpu_count() or 1
+    chunksize = max(1, args.count // (workers * 8))
+    seen = {}
+    duplicates = []
+    started = time.time()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(loaded["bank"], options),
+    ) as pool:
+        for sheet_no, sig in pool.map(_make_one, range(1, args.count + 1), chunksize=chunksize):
+            if sig in seen:
+                duplicates.append((seen[sig], sheet_no))
+            else:
+                seen[sig] = sheet_no
+
+    print(f"完成 {args.count} 份卷子 → {args.out}（{time.time() - started:.1f} 秒，{workers} processes）")
+    if duplicates:
+        print(f"⚠ 有 {len(duplicates)} 份卷子和前面的重複：{duplicates[:10]}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())